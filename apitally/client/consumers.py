@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import threading
+from functools import lru_cache
 from typing import Any, Optional, Union
 
 
@@ -16,10 +17,7 @@ class Consumer:
             return None
         if isinstance(consumer, Consumer):
             return consumer
-        consumer = str(consumer).strip()
-        if not consumer:
-            return None
-        return cls(identifier=consumer)
+        return _consumer_from_string(str(consumer))
 
     def update(self, name: Optional[str] = None, group: Optional[str] = None) -> bool:
         name = str(name).strip()[:64] if name else None
@@ -34,6 +32,15 @@ class Consumer:
         return updated
 
 
+@lru_cache(maxsize=1024)
+def _consumer_from_string(identifier: str) -> Optional[Consumer]:
+    # Consumers identified by a plain string have no name or group, so instances can be shared across requests
+    identifier = identifier.strip()
+    if not identifier:
+        return None
+    return Consumer(identifier=identifier)
+
+
 class ConsumerRegistry:
     def __init__(self) -> None:
         self.consumers: dict[str, Consumer] = {}
@@ -2,14 +2,11 @@ from __future__ import annotations
 
 import contextlib
 import threading
-from collections import Counter
-from dataclasses import dataclass
-from math import floor
-from typing import Any, Optional
+from functools import lru_cache
+from typing import Any, NamedTuple, Optional
 
 
-@dataclass(frozen=True)
-class RequestInfo:
+class RequestInfo(NamedTuple):
     consumer: Optional[str]
     method: str
     path: str
@@ -18,12 +15,13 @@ class RequestInfo:
 
 class RequestCounter:
     def __init__(self) -> None:
-        self.request_counts: Counter[RequestInfo] = Counter()
-        self.request_size_sums: Counter[RequestInfo] = Counter()
-        self.response_size_sums: Counter[RequestInfo] = Counter()
-        self.response_times: dict[RequestInfo, Counter[int]] = {}
-        self.request_sizes: dict[RequestInfo, Counter[int]] = {}
-        self.response_sizes: dict[RequestInfo, Counter[int]] = {}
+        # Plain dicts instead of Counters, as incrementing a Counter item is about twice as slow
+        self.request_counts: dict[RequestInfo, int] = {}
+        self.request_size_sums: dict[RequestInfo, int] = {}
+        self.response_size_sums: dict[RequestInfo, int] = {}
+        self.response_times: dict[RequestInfo, dict[int, int]] = {}
+        self.request_sizes: dict[RequestInfo, dict[int, int]] = {}
+        self.response_sizes: dict[RequestInfo, dict[int, int]] = {}
         self._lock = threading.Lock()
 
     def add_request(
@@ -36,30 +34,30 @@ class RequestCounter:
         request_size: str | int | None = None,
         response_size: str | int | None = None,
     ) -> None:
-        request_info = RequestInfo(
-            consumer=consumer,
-            method=method.upper(),
-            path=path,
-            status_code=status_code,
-        )
-        response_time_ms_bin = int(floor(response_time / 0.01) * 10)  # In ms, rounded down to nearest 10ms
+        request_info = _get_request_info(consumer, method.upper(), path, status_code)
+        # In ms, rounded down to nearest 10ms (adding 1ns keeps exact boundaries like 0.57s out of the lower bin)
+        response_time_ms_bin = int(response_time * 1000 + 1e-6) // 10 * 10
         with self._lock:
-            self.request_counts[request_info] += 1
-            self.response_times.setdefault(request_info, Counter())[response_time_ms_bin] += 1
+            self.request_counts[request_info] = self.request_counts.get(request_info, 0) + 1
+            _increment_bin(self.response_times, request_info, response_time_ms_bin)
             if request_size is not None:
                 with contextlib.suppress(ValueError):
                     request_size = int(request_size)
                     if request_size >= 0:
                         request_size_kb_bin = request_size // 1000  # In KB, rounded down to nearest 1KB
-                        self.request_size_sums[request_info] += request_size
-                        self.request_sizes.setdefault(request_info, Counter())[request_size_kb_bin] += 1
+                        self.request_size_sums[request_info] = (
+                            self.request_size_sums.get(request_info, 0) + request_size
+                        )
+                        _increment_bin(self.request_sizes, request_info, request_size_kb_bin)
             if response_size is not None:
                 with contextlib.suppress(ValueError):
                     response_size = int(response_size)
                     if response_size >= 0:
                         response_size_kb_bin = response_size // 1000  # In KB, rounded down to nearest 1KB
-                        self.response_size_sums[request_info] += response_size
-                        self.response_sizes.setdefault(request_info, Counter())[response_size_kb_bin] += 1
+                        self.response_size_sums[request_info] = (
+                            self.response_size_sums.get(request_info, 0) + response_size
+                        )
+                        _increment_bin(self.response_sizes, request_info, response_size_kb_bin)
 
     def get_and_reset_requests(self) -> list[dict[str, Any]]:
         data: list[dict[str, Any]] = []
@@ -74,9 +72,9 @@ class RequestCounter:
                         "request_count": count,
                         "request_size_sum": self.request_size_sums.get(request_info, 0),
                         "response_size_sum": self.response_size_sums.get(request_info, 0),
-                        "response_times": self.response_times.get(request_info) or Counter(),
-                        "request_sizes": self.request_sizes.get(request_info) or Counter(),
-                        "response_sizes": self.response_sizes.get(request_info) or Counter(),
+                        "response_times": self.response_times.get(request_info) or {},
+                        "request_sizes": self.request_sizes.get(request_info) or {},
+                        "response_sizes": self.response_sizes.get(request_info) or {},
                     }
                 )
             self.request_counts.clear()
@@ -86,3 +84,17 @@ class RequestCounter:
             self.request_sizes.clear()
             self.response_sizes.clear()
         return data
+
+
+@lru_cache(maxsize=4096)
+def _get_request_info(consumer: Optional[str], method: str, path: str, status_code: int) -> RequestInfo:
+    # Reusing instances lets counter dict lookups match keys by identity instead of comparing tuples element-wise
+    return RequestInfo(consumer=consumer, method=method, path=path, status_code=status_code)
+
+
+def _increment_bin(bins: dict[RequestInfo, dict[int, int]], request_info: RequestInfo, value_bin: int) -> None:
+    # Unlike setdefault, this only creates a new dict for the first request with a given key
+    counts = bins.get(request_info)
+    if counts is None:
+        counts = bins[request_info] = {}
+    counts[value_bin] = counts.get(value_bin, 0) + 1
@@ -1,13 +1,29 @@
 import gzip
 import json
 import sys
+from functools import lru_cache
 from importlib.metadata import PackageNotFoundError, version
-from typing import Any, Optional, Union
+from typing import Any, Iterable, Optional, Union
+
+
+try:
+    import orjson  # ty: ignore[unresolved-import]
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+PYTHON_VERSION = f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}"
 
 
 def parse_int(x: Union[str, bytes, int, None]) -> Optional[int]:
     if x is None:
         return None
+    return _parse_int(x)
+
+
+@lru_cache(maxsize=1024)
+def _parse_int(x: Union[str, bytes, int]) -> Optional[int]:
+    # Cached as this is mostly used for Content-Length header values, which repeat a lot
     try:
         return int(x)
     except ValueError:
@@ -21,11 +37,25 @@ def try_json_loads(s: bytes, encoding: Optional[str] = None) -> Any:
         except Exception:
             pass
     try:
-        return json.loads(s)
+        return orjson.loads(s) if orjson is not None else json.loads(s)
     except Exception:
         return None
 
 
+def json_dumps(obj: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def has_request_hooks(obj: object, base: type) -> bool:
+    # The request-based hooks are only worth calling (and creating a request object for) if a subclass overrides them
+    return any(
+        getattr(type(obj), name) is not getattr(base, name)
+        for name in ("get_route_name", "get_route_path", "get_consumer")
+    )
+
+
 def get_versions(*packages, app_version: Optional[str] = None) -> dict[str, str]:
     versions = _get_common_package_versions()
     for package in packages:
@@ -37,7 +67,7 @@ def get_versions(*packages, app_version: Optional[str] = None) -> dict[str, str]
 
 def _get_common_package_versions() -> dict[str, Optional[str]]:
     return {
-        "python": f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}",
+        "python": PYTHON_VERSION,
         "apitally": _get_package_version("apitally"),
         "uvicorn": _get_package_version("uvicorn"),
         "hypercorn": _get_package_version("hypercorn"),
@@ -47,8 +77,36 @@ def _get_common_package_versions() -> dict[str, Optional[str]]:
     }
 
 
+@lru_cache(maxsize=None)
 def _get_package_version(name: str) -> Optional[str]:
     try:
         return version(name)
     except PackageNotFoundError:
         return None
+
+
+def get_header(headers: Iterable[tuple[bytes, bytes]], name: bytes) -> Optional[str]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def get_response_headers(
+    headers: Iterable[tuple[bytes, bytes]],
+) -> tuple[Optional[str], Optional[str], Optional[str]]:
+    # Single pass over the raw headers to get Content-Length, Content-Type and Transfer-Encoding
+    content_length = content_type = transfer_encoding = None
+    for key, value in headers:
+        key = key.lower()
+        if key == b"content-length":
+            content_length = value.decode("latin-1")
+        elif key == b"content-type":
+            content_type = value.decode("latin-1")
+        elif key == b"transfer-encoding":
+            transfer_encoding = value.decode("latin-1")
+    return content_length, content_type, transfer_encoding
+
+
+def decode_headers(headers: Iterable[tuple[bytes, bytes]]) -> list[tuple[str, str]]:
+    return [(key.decode("latin-1"), value.decode("latin-1")) for key, value in headers]
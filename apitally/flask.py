@@ -12,7 +12,6 @@ from flask import Flask, g
 from flask.wrappers import Request, Response
 from werkzeug.datastructures import Headers
 from werkzeug.exceptions import NotFound
-from werkzeug.test import Client
 
 from apitally.client.client_threading import ApitallyClient
 from apitally.client.consumers import Consumer as ApitallyConsumer
@@ -34,7 +33,7 @@ except ImportError:  # pragma: no cover
 
 
 if TYPE_CHECKING:
-    from _typeshed.wsgi import StartResponse, WSGIApplication, WSGIEnvironment
+    from _typeshed.wsgi import StartResponse, WSGIEnvironment
     from werkzeug.routing.map import Map
 
 
@@ -50,6 +49,17 @@ class ApitallyMiddleware:
     - Reference: https://docs.apitally.io/reference/python
     """
 
+    __slots__ = (
+        "app",
+        "wsgi_app",
+        "client",
+        "versions",
+        "capture_request_body",
+        "capture_response_body",
+        "log_buffer_var",
+        "log_handler",
+    )
+
     def __init__(
         self,
         app: Flask,
@@ -98,16 +108,17 @@ class ApitallyMiddleware:
             setup_log_capture(self.log_handler)
 
     def delayed_set_startup_data(self, app_version: Optional[str] = None, openapi_url: Optional[str] = None) -> None:
+        self.versions = get_versions("flask", app_version=app_version)
         # Short delay to allow app routes to be registered first
         timer = Timer(
             1.0,
             self._delayed_set_startup_data,
-            kwargs={"app_version": app_version, "openapi_url": openapi_url},
+            kwargs={"openapi_url": openapi_url},
         )
         timer.start()
 
-    def _delayed_set_startup_data(self, app_version: Optional[str] = None, openapi_url: Optional[str] = None) -> None:
-        data = _get_startup_data(self.app, app_version, openapi_url)
+    def _delayed_set_startup_data(self, openapi_url: Optional[str] = None) -> None:
+        data = _get_startup_data(self.app, self.versions, openapi_url)
         self.client.set_startup_data(data)
         self.client.start_sync_loop()
 
@@ -253,15 +264,13 @@ def set_consumer(identifier: str, name: Optional[str] = None, group: Optional[st
     g.apitally_consumer = ApitallyConsumer(identifier, name=name, group=group)
 
 
-def _get_startup_data(
-    app: Flask, app_version: Optional[str] = None, openapi_url: Optional[str] = None
-) -> dict[str, Any]:
+def _get_startup_data(app: Flask, versions: dict[str, str], openapi_url: Optional[str] = None) -> dict[str, Any]:
     data: dict[str, Any] = {}
     if openapi_url and (openapi := _get_openapi(app, openapi_url)):
         data["openapi"] = openapi
     if paths := _get_paths(app.url_map):
         data["paths"] = paths
-    data["versions"] = get_versions("flask", app_version=app_version)
+    data["versions"] = versions
     data["client"] = "python:flask"
     return data
 
@@ -276,9 +285,13 @@ def _get_paths(url_map: Map) -> list[dict[str, str]]:
     ]
 
 
-def _get_openapi(app: WSGIApplication, openapi_url: str) -> Optional[str]:
-    client = Client(app)
-    response = client.get(openapi_url)
+def _get_openapi(app: Flask, openapi_url: str) -> Optional[str]:
+    # Dispatch the request directly instead of running it through the whole WSGI stack
+    with app.test_request_context(openapi_url):
+        try:
+            response = app.full_dispatch_request()
+        except Exception:
+            return None
     if response.status_code != 200:
         return None
     return response.get_data(as_text=True)
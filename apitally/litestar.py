@@ -1,19 +1,20 @@
-import json
 import logging
+import re
 import time
 from contextvars import ContextVar
-from typing import Callable, Optional, Union
+from typing import Any, Callable, Iterable, Optional, Union, cast
 from warnings import warn
 
 from httpx import Proxy
 from litestar.app import DEFAULT_OPENAPI_CONFIG, Litestar
 from litestar.config.app import AppConfig
 from litestar.connection import Request
-from litestar.datastructures import Headers
+from litestar.datastructures import URL
 from litestar.enums import ScopeType
 from litestar.handlers import HTTPRouteHandler
 from litestar.plugins import InitPluginProtocol
-from litestar.types import ASGIApp, Message, Receive, Scope, Send
+from litestar.routes import HTTPRoute
+from litestar.types import ASGIApp, HTTPScope, Message, Receive, Scope, Send
 
 from apitally.client.client_asyncio import ApitallyClient
 from apitally.client.consumers import Consumer as ApitallyConsumer
@@ -24,8 +25,18 @@ from apitally.client.request_logging import (
     RequestLogger,
     RequestLoggingConfig,
     RequestLoggingKwargs,
+    SpanDict,
+)
+from apitally.common import (
+    decode_headers,
+    get_header,
+    get_response_headers,
+    get_versions,
+    has_request_hooks,
+    json_dumps,
+    parse_int,
+    try_json_loads,
 )
-from apitally.common import get_versions, parse_int, try_json_loads
 
 
 try:
@@ -36,6 +47,12 @@ except ImportError:  # pragma: no cover
 
 __all__ = ["ApitallyPlugin", "ApitallyConsumer", "RequestLoggingConfig", "set_consumer"]
 
+MAX_VALIDATION_ERROR_BODY_SIZE = 4_096  # 4 KB
+VALIDATION_DETAIL_PATTERN = re.compile("validation", re.IGNORECASE)
+
+_perf_counter_ns = time.perf_counter_ns
+_time = time.time
+
 
 class ApitallyPlugin(InitPluginProtocol):
     def __init__(
@@ -78,6 +95,10 @@ class ApitallyPlugin(InitPluginProtocol):
         self.consumer_callback = consumer_callback or identify_consumer_callback
 
         self.openapi_path = "/schema"
+        self.openapi_path_prefix = "/schema/"
+        self.openapi: Optional[str] = None
+        self.route_info: dict[int, tuple[Optional[str], bool]] = {}
+        self.has_request_hooks = has_request_hooks(self, ApitallyPlugin)
         self.capture_request_body = (
             self.client.request_logger.config.enabled and self.client.request_logger.config.log_request_body
         )
@@ -107,9 +128,22 @@ class ApitallyPlugin(InitPluginProtocol):
             self.openapi_path = openapi_config.openapi_router.path
         elif openapi_config.path is not None:
             self.openapi_path = openapi_config.path
+        self.openapi_path_prefix = self.openapi_path + "/"
+
+        # Resolve path and filter decision for each route handler once, instead of on every request
+        self.route_info = {
+            id(route_handler): self._get_route_info(route_handler)
+            for route in app.routes
+            if isinstance(route, HTTPRoute)
+            for route_handler in route.route_handlers
+        }
+
+        # Serializing the OpenAPI schema is expensive, so only do it once (e.g. if the app is started again in tests)
+        if self.openapi is None:
+            self.openapi = _get_openapi(app)
 
         data = {
-            "openapi": _get_openapi(app),
+            "openapi": self.openapi,
             "paths": [route for route in _get_routes(app) if not self.filter_path(route["path"])],
             "versions": get_versions("litestar", app_version=self.app_version),
             "client": "python:litestar",
@@ -121,206 +155,272 @@ class ApitallyPlugin(InitPluginProtocol):
         scope["state"]["exception"] = exception
 
     def middleware_factory(self, app: ASGIApp) -> ASGIApp:
+        if not self.client.enabled:
+            # Client was disabled on init (e.g. invalid client ID) and stays disabled, so don't wrap the app at all
+            return app
+
+        # Bind attributes used on every request to locals once
+        client = self.client
+        span_collector = client.span_collector
+        log_buffer_var = self.log_buffer_var
+        capture_logs = self.log_handler is not None
+        has_request_hooks = self.has_request_hooks
+        capture_request_body = self.capture_request_body
+
         async def middleware(scope: Scope, receive: Receive, send: Send) -> None:
-            if not self.client.enabled or scope["type"] != ScopeType.HTTP or scope["method"] == "OPTIONS":
+            if not client.enabled or scope["type"] != ScopeType.HTTP or scope["method"] == "OPTIONS":
                 await app(scope, receive, send)
                 return
 
-            timestamp = time.time()
-            request: Request = Request(scope)
-            request_size = parse_int(request.headers.get("Content-Length"))
-            request_body = b""
+            route_handler = cast(HTTPRouteHandler, scope["route_handler"])
+            path, filtered = self.get_route_info(route_handler)
+            if filtered:
+                await app(scope, receive, send)
+                return
+
+            timestamp = _time()
+            request = Request(scope, receive, send) if has_request_hooks else None
+            request_size = parse_int(get_header(scope["headers"], b"content-length"))
+            request_body = bytearray() if capture_request_body else None
             request_body_too_large = request_size is not None and request_size > MAX_BODY_SIZE
             response_status = 0
             response_time = 0.0
-            response_headers = Headers()
-            response_body = b""
+            response_headers: Iterable[tuple[bytes, bytes]] = []
+            response_body = bytearray()
+            response_body_limit = 0
             response_body_too_large = False
             response_size: Optional[int] = None
             response_chunked = False
-            response_content_type: Optional[str] = None
             logs: list[logging.LogRecord] = []
             trace_id: Optional[int] = None
-            start_time = time.perf_counter()
-
-            async def receive_wrapper():
-                nonlocal request_body, request_body_too_large
-                message = await receive()
-                if message["type"] == "http.request" and self.capture_request_body and not request_body_too_large:
-                    request_body += message.get("body", b"")
-                    if len(request_body) > MAX_BODY_SIZE:
-                        request_body_too_large = True
-                        request_body = b""
-                return message
+            start_time_ns = _perf_counter_ns()
+
+            app_receive = receive
+            if request_body is not None:
+
+                async def receive_wrapper():
+                    nonlocal request_body_too_large
+                    message = await receive()
+                    if message["type"] == "http.request" and not request_body_too_large:
+                        body = message.get("body", b"")
+                        # Compare before extending to avoid copying a chunk that goes over the limit
+                        if len(request_body) + len(body) > MAX_BODY_SIZE:
+                            request_body_too_large = True
+                            request_body.clear()
+                        else:
+                            request_body.extend(body)
+                    return message
+
+                app_receive = receive_wrapper
 
             async def send_wrapper(message: Message):
                 nonlocal \
                     response_time, \
                     response_status, \
                     response_headers, \
-                    response_body, \
+                    response_body_limit, \
                     response_body_too_large, \
                     response_chunked, \
-                    response_content_type, \
                     response_size
                 if message["type"] == "http.response.start":
-                    response_time = time.perf_counter() - start_time
+                    response_time = (_perf_counter_ns() - start_time_ns) / 1e9
                     response_status = message["status"]
-                    response_headers = Headers(message["headers"])
-                    response_chunked = (
-                        response_headers.get("Transfer-Encoding") == "chunked"
-                        or "Content-Length" not in response_headers
+                    response_headers = message["headers"]
+                    response_content_length, response_content_type, response_transfer_encoding = get_response_headers(
+                        response_headers
+                    )
+                    response_chunked = response_transfer_encoding == "chunked" or response_content_length is None
+                    response_size = parse_int(response_content_length) if not response_chunked else 0
+                    if RequestLogger.is_supported_content_type(response_content_type):
+                        # Bodies of 400 responses are only needed for validation error parsing, unless logged
+                        if self.capture_response_body:
+                            response_body_limit = MAX_BODY_SIZE
+                        elif response_status == 400:
+                            response_body_limit = MAX_VALIDATION_ERROR_BODY_SIZE
+                    response_body_too_large = (
+                        response_body_limit > 0 and response_size is not None and response_size > response_body_limit
                     )
-                    response_content_type = response_headers.get("Content-Type")
-                    response_size = parse_int(response_headers.get("Content-Length")) if not response_chunked else 0
-                    response_body_too_large = response_size is not None and response_size > MAX_BODY_SIZE
                 elif message["type"] == "http.response.body":
                     if response_chunked and response_size is not None:
                         response_size += len(message.get("body", b""))
-                    if (
-                        (self.capture_response_body or response_status == 400)
-                        and RequestLogger.is_supported_content_type(response_content_type)
-                        and not response_body_too_large
-                    ):
-                        response_body += message.get("body", b"")
-                        if len(response_body) > MAX_BODY_SIZE:
+                    if response_body_limit and not response_body_too_large:
+                        body = message.get("body", b"")
+                        if len(response_body) + len(body) > response_body_limit:
                             response_body_too_large = True
-                            response_body = b""
+                            response_body.clear()
+                        else:
+                            response_body.extend(body)
                 await send(message)
 
+            # Only bind the log buffer if a log handler is installed to collect into it
+            token = log_buffer_var.set(logs) if capture_logs else None
             try:
-                token = self.log_buffer_var.set(logs)
-                with self.client.span_collector.collect() as trace_id:
-                    await app(scope, receive_wrapper, send_wrapper)
+                with span_collector.collect() as trace_id:
+                    await app(scope, app_receive, send_wrapper)
             finally:
-                self.log_buffer_var.reset(token)
+                if token is not None:
+                    log_buffer_var.reset(token)
 
-            name = self.get_route_name(request)
-            path = self.get_route_path(request)
+            if request is not None:
+                name = self.get_route_name(request)
+                path = self.get_route_path(request)
+            else:
+                name = self._get_route_name(route_handler)
 
-            self.client.span_collector.set_root_span_name(trace_id, name)
-            spans = self.client.span_collector.get_and_clear_spans(trace_id)
+            span_collector.set_root_span_name(trace_id, name)
+            spans = span_collector.get_and_clear_spans(trace_id)
 
-            if response_status < 100 or self.filter_path(path):
+            if response_status < 100 or (request is not None and self.filter_path(path)):
                 return  # pragma: no cover
 
-            if request_body_too_large:
-                request_body = BODY_TOO_LARGE
-            if response_body_too_large:
-                response_body = BODY_TOO_LARGE
+            self.add_request(
+                timestamp=timestamp,
+                scope=scope,
+                request=request,
+                request_body=BODY_TOO_LARGE if request_body_too_large else bytes(request_body or b""),
+                request_size=request_size,
+                path=path,
+                response_status=response_status,
+                response_time=response_time,
+                response_headers=response_headers,
+                response_body=BODY_TOO_LARGE if response_body_too_large else bytes(response_body),
+                response_size=response_size,
+                logs=logs,
+                spans=spans,
+                trace_id=trace_id,
+            )
 
-            consumer = self.get_consumer(request)
-            consumer_identifier = consumer.identifier if consumer else None
-            self.client.consumer_registry.add_or_update_consumer(consumer)
+        return middleware
 
-            if path is not None:
-                self.client.request_counter.add_request(
-                    consumer=consumer_identifier,
-                    method=request.method,
-                    path=path,
-                    status_code=response_status,
-                    response_time=response_time,
-                    request_size=request_size,
-                    response_size=response_size,
-                )
+    def add_request(
+        self,
+        timestamp: float,
+        scope: HTTPScope,
+        request: Optional[Request],
+        request_body: bytes,
+        request_size: Optional[int],
+        path: Optional[str],
+        response_status: int,
+        response_time: float,
+        response_headers: Iterable[tuple[bytes, bytes]],
+        response_body: bytes,
+        response_size: Optional[int],
+        logs: list[logging.LogRecord],
+        spans: Optional[list[SpanDict]],
+        trace_id: Optional[int],
+    ) -> None:
+        method = scope["method"]
+        exception = scope["state"].get("exception")
+        client = self.client
+        consumer = self.get_consumer(request) if request is not None else self._get_consumer(scope)
+        consumer_identifier = consumer.identifier if consumer else None
+        client.consumer_registry.add_or_update_consumer(consumer)
+
+        if path is not None:
+            client.request_counter.add_request(
+                consumer=consumer_identifier,
+                method=method,
+                path=path,
+                status_code=response_status,
+                response_time=response_time,
+                request_size=request_size,
+                response_size=response_size,
+            )
 
-                if response_status == 400 and response_body and len(response_body) < 4096:
-                    body = try_json_loads(response_body, encoding=response_headers.get("Content-Encoding"))
-                    if (
-                        isinstance(body, dict)
-                        and "detail" in body
-                        and isinstance(body["detail"], str)
-                        and "validation" in body["detail"].lower()
-                        and "extra" in body
-                        and isinstance(body["extra"], list)
-                    ):
-                        self.client.validation_error_counter.add_validation_errors(
-                            consumer=consumer_identifier,
-                            method=request.method,
-                            path=path,
-                            detail=[
-                                {
-                                    "loc": [error.get("source", "body")] + error["key"].split("."),
-                                    "msg": error["message"],
-                                    "type": "",
-                                }
-                                for error in body["extra"]
-                                if "key" in error and "message" in error
-                            ],
-                        )
-
-                if response_status == 500 and "exception" in request.state:
-                    self.client.server_error_counter.add_server_error(
+            if response_status == 400 and response_body and len(response_body) < MAX_VALIDATION_ERROR_BODY_SIZE:
+                content_encoding = get_header(response_headers, b"content-encoding")
+                # Litestar only lists validation errors under "extra", so 400 bodies without it are skipped unparsed
+                if content_encoding is None and b'"extra"' not in response_body:
+                    body = None
+                else:
+                    body = try_json_loads(response_body, encoding=content_encoding)
+                if (detail := _get_validation_error_detail(body)) is not None:
+                    client.validation_error_counter.add_validation_errors(
                         consumer=consumer_identifier,
-                        method=request.method,
+                        method=method,
                         path=path,
-                        exception=request.state["exception"],
+                        detail=detail,
                     )
 
-            if self.client.request_logger.enabled:
-                self.client.request_logger.log_request(
-                    request={
-                        "timestamp": timestamp,
-                        "method": request.method,
-                        "path": path,
-                        "url": str(request.url),
-                        "headers": [(k, v) for k, v in request.headers.items()],
-                        "size": request_size,
-                        "consumer": consumer_identifier,
-                        "body": request_body,
-                    },
-                    response={
-                        "status_code": response_status,
-                        "response_time": response_time,
-                        "headers": [(k, v) for k, v in response_headers.items()],
-                        "size": response_size,
-                        "body": response_body,
-                    },
-                    exception=request.state["exception"] if "exception" in request.state else None,
-                    logs=logs,
-                    spans=spans,
-                    trace_id=trace_id,
+            if response_status == 500 and exception is not None:
+                client.server_error_counter.add_server_error(
+                    consumer=consumer_identifier,
+                    method=method,
+                    path=path,
+                    exception=exception,
                 )
 
-        return middleware
+        if client.request_logger.enabled:
+            client.request_logger.log_request(
+                request={
+                    "timestamp": timestamp,
+                    "method": method,
+                    "path": path,
+                    "url": str(URL.from_scope(scope)),
+                    "headers": decode_headers(scope["headers"]),
+                    "size": request_size,
+                    "consumer": consumer_identifier,
+                    "body": request_body,
+                },
+                response={
+                    "status_code": response_status,
+                    "response_time": response_time,
+                    "headers": decode_headers(response_headers),
+                    "size": response_size,
+                    "body": response_body,
+                },
+                exception=exception,
+                logs=logs,
+                spans=spans,
+                trace_id=trace_id,
+            )
 
     def get_route_name(self, request: Request) -> Optional[str]:
+        return self._get_route_name(request.route_handler)
+
+    def get_route_path(self, request: Request) -> Optional[str]:
+        return _get_route_path(request.route_handler)
+
+    def get_consumer(self, request: Request) -> Optional[ApitallyConsumer]:
+        return self._get_consumer(request.scope, request)
+
+    def _get_route_name(self, route_handler: HTTPRouteHandler) -> Optional[str]:
         try:
-            return request.route_handler.fn.__name__  # ty: ignore[unresolved-attribute]
+            return route_handler.fn.__name__  # ty: ignore[unresolved-attribute]
         except Exception:  # pragma: no cover
             return None
 
-    def get_route_path(self, request: Request) -> Optional[str]:
-        if not request.route_handler.paths:
-            return None
-        path: list[str] = []
-        for layer in request.route_handler.ownership_layers:
-            if isinstance(layer, HTTPRouteHandler):
-                if len(layer.paths) == 0:
-                    return None  # pragma: no cover
-                path.append(list(layer.paths)[0].lstrip("/"))
-            else:
-                path.append(layer.path.lstrip("/"))
-        return "/" + "/".join(filter(None, path))
+    def get_route_info(self, route_handler: HTTPRouteHandler) -> tuple[Optional[str], bool]:
+        # Route handlers live as long as the app, so their resolved paths can be cached
+        key = id(route_handler)
+        if key not in self.route_info:
+            self.route_info[key] = self._get_route_info(route_handler)
+        return self.route_info[key]
+
+    def _get_route_info(self, route_handler: HTTPRouteHandler) -> tuple[Optional[str], bool]:
+        path = _get_route_path(route_handler)
+        return path, self.filter_path(path)
 
     def filter_path(self, path: Optional[str]) -> bool:
         if path is not None and self.filter_openapi_paths and self.openapi_path:
-            return path == self.openapi_path or path.startswith(self.openapi_path + "/")
+            return path == self.openapi_path or path.startswith(self.openapi_path_prefix)
         return False  # pragma: no cover
 
-    def get_consumer(self, request: Request) -> Optional[ApitallyConsumer]:
-        if hasattr(request.state, "apitally_consumer") and request.state.apitally_consumer:
-            return ApitallyConsumer.from_string_or_object(request.state.apitally_consumer)
-        if hasattr(request.state, "consumer_identifier") and request.state.consumer_identifier:
+    def _get_consumer(self, scope: HTTPScope, request: Optional[Request] = None) -> Optional[ApitallyConsumer]:
+        # Read directly from the scope state, as `request.state` creates a new State object on every access
+        state = scope["state"]
+        if consumer := state.get("apitally_consumer"):
+            return ApitallyConsumer.from_string_or_object(consumer)
+        if consumer_identifier := state.get("consumer_identifier"):
             # Keeping this for legacy support
             warn(
                 "Providing a consumer identifier via `request.state.consumer_identifier` is deprecated, "
                 "use `request.state.apitally_consumer` instead.",
                 DeprecationWarning,
             )
-            return ApitallyConsumer.from_string_or_object(request.state.consumer_identifier)
+            return ApitallyConsumer.from_string_or_object(consumer_identifier)
         if self.consumer_callback is not None:
-            consumer = self.consumer_callback(request)
+            consumer = self.consumer_callback(request if request is not None else Request(scope))
             return ApitallyConsumer.from_string_or_object(consumer)
         return None
 
@@ -329,15 +429,49 @@ def set_consumer(request: Request, identifier: str, name: Optional[str] = None,
     request.state.apitally_consumer = ApitallyConsumer(identifier, name=name, group=group)
 
 
+def _get_route_path(route_handler: HTTPRouteHandler) -> Optional[str]:
+    if not route_handler.paths:
+        return None
+    parts: list[str] = []
+    for layer in route_handler.ownership_layers:
+        if isinstance(layer, HTTPRouteHandler):
+            if len(layer.paths) == 0:
+                return None  # pragma: no cover
+            parts.append(next(iter(layer.paths)).lstrip("/"))
+        else:
+            parts.append(layer.path.lstrip("/"))
+    return "/" + "/".join(part for part in parts if part)
+
+
+def _get_validation_error_detail(body: Any) -> Optional[list[dict[str, Any]]]:
+    # Litestar validation errors look like {"detail": "Validation failed for ...", "extra": [...]}
+    try:
+        extra = body["extra"]
+        if VALIDATION_DETAIL_PATTERN.search(body["detail"]) is None or not isinstance(extra, list):
+            return None
+    except (KeyError, TypeError):
+        return None
+    detail = []
+    for error in extra:
+        try:
+            loc = [error.get("source", "body"), *error["key"].split(".")]
+            message = error["message"]
+        except (KeyError, TypeError, AttributeError):
+            continue
+        detail.append({"loc": loc, "msg": message, "type": ""})
+    return detail
+
+
 def _get_openapi(app: Litestar) -> str:
     schema = app.openapi_schema.to_schema()
-    return json.dumps(schema)
+    return json_dumps(schema)
 
 
 def _get_routes(app: Litestar) -> list[dict[str, str]]:
     return [
         {"method": method, "path": route.path}
         for route in app.routes
+        if route.scope_type == ScopeType.HTTP
         for method in route.methods
-        if route.scope_type == ScopeType.HTTP and method not in ["OPTIONS", "HEAD"]
+        if method not in {"OPTIONS", "HEAD"}
     ]
@@ -3,15 +3,21 @@ from __future__ import annotations
 import functools
 from contextlib import contextmanager, suppress
 from inspect import iscoroutinefunction
-from typing import TYPE_CHECKING, Any, Awaitable, Callable, Iterator, ParamSpec, TypeVar, Union, overload
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Iterator, Optional, ParamSpec, TypeVar, Union, overload
 
 
+try:
+    from opentelemetry import trace
+    from opentelemetry.trace import NoOpTracer, ProxyTracer
+except ImportError:  # pragma: no cover
+    trace = None
+
 if TYPE_CHECKING:
     from httpx import AsyncClient as HttpxAsyncClient
     from httpx import Client as HttpxClient
     from mysql.connector.abstracts import MySQLConnectionAbstract  # ty: ignore[unresolved-import]
     from mysql.connector.pooling import PooledMySQLConnection  # ty: ignore[unresolved-import]
-    from opentelemetry.trace import Span
+    from opentelemetry.trace import Span, Tracer
     from opentelemetry.util.types import Attributes as SpanAttributes
     from psycopg import AsyncConnection as PsycopgAsyncConnection  # ty: ignore[unresolved-import]
     from psycopg import Connection as PsycopgConnection  # ty: ignore[unresolved-import]
@@ -23,6 +29,31 @@ if TYPE_CHECKING:
 P = ParamSpec("P")
 R = TypeVar("R")
 
+_tracer: Optional[Tracer] = None
+_has_tracer_provider = False
+
+
+def _get_tracer(caller: str) -> Tracer:
+    # Cache the tracer, as get_tracer() creates a new tracer object on every call.
+    # If no tracer provider is set yet, this is a proxy tracer that picks up the provider once it is set.
+    global _tracer
+    if _tracer is None:
+        if trace is None:  # pragma: no cover
+            raise RuntimeError(f"`{caller}` requires the `opentelemetry-api` package")
+        _tracer = trace.get_tracer("apitally.otel")
+    return _tracer
+
+
+def _is_tracing_enabled(tracer: Tracer) -> bool:
+    # Without a tracer provider, spans are non-recording and creating them is wasted work.
+    # A proxy tracer delegates to a no-op tracer until a provider is set, which can only happen once,
+    # so stop checking after a real tracer has been found.
+    global _has_tracer_provider
+    if not _has_tracer_provider:
+        delegate = tracer._tracer if isinstance(tracer, ProxyTracer) else tracer
+        _has_tracer_provider = not isinstance(delegate, NoOpTracer)
+    return _has_tracer_provider
+
 
 @overload
 def instrument(func: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]: ...
@@ -33,12 +64,7 @@ def instrument(func: Callable[P, R]) -> Callable[P, R]: ...
 
 
 def instrument(func: Callable[P, R]) -> Union[Callable[P, R], Callable[P, Awaitable[R]]]:
-    try:
-        from opentelemetry import trace
-    except ImportError:  # pragma: no cover
-        raise RuntimeError("`instrument()` requires the `opentelemetry-api` package")
-
-    tracer = trace.get_tracer("apitally.otel")
+    tracer = _get_tracer("instrument()")
     span_name = func.__name__  # ty: ignore[unresolved-attribute]
     span_attributes: dict[str, str | int] = {
         "code.file.path": func.__code__.co_filename,  # ty: ignore[unresolved-attribute]
@@ -50,6 +76,8 @@ def instrument(func: Callable[P, R]) -> Union[Callable[P, R], Callable[P, Awaita
 
         @functools.wraps(func)
         async def async_wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            if not _is_tracing_enabled(tracer):
+                return await func(*args, **kwargs)
             with tracer.start_as_current_span(span_name, attributes=span_attributes):
                 return await func(*args, **kwargs)
 
@@ -58,6 +86,8 @@ def instrument(func: Callable[P, R]) -> Union[Callable[P, R], Callable[P, Awaita
 
         @functools.wraps(func)
         def sync_wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            if not _is_tracing_enabled(tracer):
+                return func(*args, **kwargs)
             with tracer.start_as_current_span(span_name, attributes=span_attributes):
                 return func(*args, **kwargs)
 
@@ -66,12 +96,7 @@ def instrument(func: Callable[P, R]) -> Union[Callable[P, R], Callable[P, Awaita
 
 @contextmanager
 def span(name: str, attributes: SpanAttributes = None) -> Iterator[Span]:
-    try:
-        from opentelemetry import trace
-    except ImportError:  # pragma: no cover
-        raise RuntimeError("`span()` requires the `opentelemetry-api` package")
-
-    tracer = trace.get_tracer("apitally.otel")
+    tracer = _get_tracer("span()")
     with tracer.start_as_current_span(name, attributes=attributes) as span:
         yield span
 
@@ -1,19 +1,19 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import time
 from contextlib import asynccontextmanager
 from contextvars import ContextVar
-from typing import Any, Awaitable, Callable, Optional, Union
+from typing import Any, Awaitable, Callable, Iterable, Optional, Union
 from warnings import warn
 
-from httpx import HTTPStatusError, Proxy
+from httpx import Proxy
 from starlette.applications import Starlette
-from starlette.datastructures import Headers
+from starlette.datastructures import URL
 from starlette.requests import Request
 from starlette.routing import BaseRoute, Match, Route, Router
 from starlette.schemas import EndpointInfo, SchemaGenerator
-from starlette.testclient import TestClient
 from starlette.types import ASGIApp, Lifespan, Message, Receive, Scope, Send
 
 from apitally.client.client_asyncio import ApitallyClient
@@ -26,7 +26,15 @@ from apitally.client.request_logging import (
     RequestLoggingConfig,
     RequestLoggingKwargs,
 )
-from apitally.common import get_versions, parse_int, try_json_loads
+from apitally.common import (
+    decode_headers,
+    get_header,
+    get_response_headers,
+    get_versions,
+    has_request_hooks,
+    parse_int,
+    try_json_loads,
+)
 
 
 try:
@@ -39,6 +47,9 @@ __all__ = ["ApitallyMiddleware", "ApitallyConsumer", "RequestLoggingConfig", "se
 
 logger = get_logger(__name__)
 
+_perf_counter = time.perf_counter
+_time = time.time
+
 
 class ApitallyMiddleware:
     """
@@ -81,6 +92,8 @@ class ApitallyMiddleware:
         self.openapi_url = openapi_url
         self.consumer_callback = consumer_callback or identify_consumer_callback
         self.capture_client_disconnects = capture_client_disconnects
+        self.route_cache: dict[int, BaseRoute] = {}
+        self.has_request_hooks = has_request_hooks(self, ApitallyMiddleware)
 
         if kwargs and request_logging_config is None:
             request_logging_config = RequestLoggingConfig.from_kwargs(kwargs)
@@ -113,7 +126,7 @@ class ApitallyMiddleware:
         )
 
     async def on_startup(self) -> None:
-        data = _get_startup_data(self.app, app_version=self.app_version, openapi_url=self.openapi_url)
+        data = await _get_startup_data(self.app, app_version=self.app_version, openapi_url=self.openapi_url)
         self.client.set_startup_data(data)
         self.client.start_sync_loop()
 
@@ -122,72 +135,85 @@ class ApitallyMiddleware:
             await self.app(scope, receive, send)
             return
 
-        timestamp = time.time()
-        request = Request(scope, receive, send)
-        request_size = parse_int(request.headers.get("Content-Length"))
-        request_body = b""
+        timestamp = _time()
+        # Only needed to check for client disconnects or call overridden hooks, so avoid creating it otherwise
+        request = Request(scope, receive, send) if self.capture_client_disconnects or self.has_request_hooks else None
+        method = scope["method"]
+        request_size = parse_int(get_header(scope["headers"], b"content-length"))
+        request_body = bytearray() if self.capture_request_body else None
         request_body_too_large = request_size is not None and request_size > MAX_BODY_SIZE
         response_status = 0
         response_time: Optional[float] = None
-        response_headers = Headers()
-        response_body = b""
+        response_headers: Iterable[tuple[bytes, bytes]] = []
+        response_body = bytearray()
         response_body_too_large = False
+        response_body_captured = False
         response_size: Optional[int] = None
         response_chunked = False
         response_content_type: Optional[str] = None
         exception: Optional[BaseException] = None
         logs: list[logging.LogRecord] = []
         trace_id: Optional[int] = None
-        start_time = time.perf_counter()
+        start_time = _perf_counter()
+
+        app_receive = receive
+        if request_body is not None:
 
-        async def receive_wrapper() -> Message:
-            nonlocal request_body, request_body_too_large
+            async def receive_wrapper() -> Message:
+                nonlocal request_body_too_large
 
-            message = await receive()
-            if message["type"] == "http.request" and self.capture_request_body and not request_body_too_large:
-                request_body += message.get("body", b"")
-                if len(request_body) > MAX_BODY_SIZE:
-                    request_body_too_large = True
-                    request_body = b""
-            return message
+                message = await receive()
+                if message["type"] == "http.request" and not request_body_too_large:
+                    body = message.get("body", b"")
+                    # Check the size before copying, so an oversized chunk is never appended
+                    if len(request_body) + len(body) > MAX_BODY_SIZE:
+                        request_body_too_large = True
+                        request_body.clear()
+                    else:
+                        request_body.extend(body)
+                return message
+
+            app_receive = receive_wrapper
 
         async def send_wrapper(message: Message) -> None:
             nonlocal \
                 response_time, \
                 response_status, \
                 response_headers, \
-                response_body, \
                 response_body_too_large, \
+                response_body_captured, \
                 response_chunked, \
                 response_content_type, \
                 response_size
 
             if message["type"] == "http.response.start":
-                response_time = time.perf_counter() - start_time
+                response_time = _perf_counter() - start_time
                 response_status = message["status"]
-                response_headers = Headers(scope=message)
-                response_chunked = (
-                    response_headers.get("Transfer-Encoding") == "chunked" or "Content-Length" not in response_headers
+                response_headers = message.get("headers", [])
+                response_content_length, response_content_type, response_transfer_encoding = get_response_headers(
+                    response_headers
                 )
-                response_content_type = response_headers.get("Content-Type")
-                response_size = parse_int(response_headers.get("Content-Length")) if not response_chunked else 0
+                response_chunked = response_transfer_encoding == "chunked" or response_content_length is None
+                response_size = parse_int(response_content_length) if not response_chunked else 0
                 response_body_too_large = response_size is not None and response_size > MAX_BODY_SIZE
+                # Decide once per response whether body chunks need to be captured
+                response_body_captured = (
+                    self.capture_response_body or response_status == 422
+                ) and RequestLogger.is_supported_content_type(response_content_type)
 
             elif message["type"] == "http.response.body":
                 if response_chunked and response_size is not None:
                     response_size += len(message.get("body", b""))
 
-                if (
-                    (self.capture_response_body or response_status == 422)
-                    and RequestLogger.is_supported_content_type(response_content_type)
-                    and not response_body_too_large
-                ):
-                    response_body += message.get("body", b"")
-                    if len(response_body) > MAX_BODY_SIZE:
+                if response_body_captured and not response_body_too_large:
+                    body = message.get("body", b"")
+                    if len(response_body) + len(body) > MAX_BODY_SIZE:
                         response_body_too_large = True
-                        response_body = b""
+                        response_body.clear()
+                    else:
+                        response_body.extend(body)
 
-            if self.capture_client_disconnects and await request.is_disconnected():
+            if self.capture_client_disconnects and request is not None and await request.is_disconnected():
                 # Client closed connection (report NGINX specific status code)
                 response_status = 499
 
@@ -196,7 +222,7 @@ class ApitallyMiddleware:
         try:
             token = self.log_buffer_var.set(logs)
             with self.client.span_collector.collect() as trace_id:
-                await self.app(scope, receive_wrapper, send_wrapper)
+                await self.app(scope, app_receive, send_wrapper)
         except BaseException as e:
             exception = e
             raise
@@ -204,19 +230,22 @@ class ApitallyMiddleware:
             self.log_buffer_var.reset(token)
 
             if response_time is None:
-                response_time = time.perf_counter() - start_time
-            if request_body_too_large:
-                request_body = BODY_TOO_LARGE
-            if response_body_too_large:
-                response_body = BODY_TOO_LARGE
-
-            name = self.get_route_name(request)
-            path = self.get_route_path(request)
+                response_time = _perf_counter() - start_time
+            request_body_bytes = BODY_TOO_LARGE if request_body_too_large else bytes(request_body or b"")
+            response_body_bytes = BODY_TOO_LARGE if response_body_too_large else bytes(response_body)
+
+            if request is not None and self.has_request_hooks:
+                name = self.get_route_name(request)
+                path = self.get_route_path(request)
+                consumer = self.get_consumer(request)
+            else:
+                name = self._get_route_name(scope)
+                path = self._get_route_path(scope)
+                consumer = self._get_consumer(scope, request)
 
             self.client.span_collector.set_root_span_name(trace_id, name)
             spans = self.client.span_collector.get_and_clear_spans(trace_id)
 
-            consumer = self.get_consumer(request)
             consumer_identifier = consumer.identifier if consumer else None
             self.client.consumer_registry.add_or_update_consumer(consumer)
 
@@ -226,7 +255,7 @@ class ApitallyMiddleware:
             if path is not None:
                 self.client.request_counter.add_request(
                     consumer=consumer_identifier,
-                    method=request.method,
+                    method=method,
                     path=path,
                     status_code=response_status,
                     response_time=response_time,
@@ -235,22 +264,28 @@ class ApitallyMiddleware:
                 )
                 if (
                     response_status == 422
-                    and response_body
-                    and response_headers.get("Content-Type", "").lower().startswith("application/json")
+                    and response_body_bytes
+                    and response_content_type is not None
+                    and response_content_type.lower().startswith("application/json")
                 ):
-                    body = try_json_loads(response_body, encoding=response_headers.get("Content-Encoding"))
+                    content_encoding = get_header(response_headers, b"content-encoding")
+                    # FastAPI validation errors always have a "detail" key, so other 422 bodies aren't worth parsing
+                    if content_encoding is None and b'"detail"' not in response_body_bytes:
+                        body = None
+                    else:
+                        body = try_json_loads(response_body_bytes, encoding=content_encoding)
                     if isinstance(body, dict) and "detail" in body and isinstance(body["detail"], list):
                         # Log FastAPI / Pydantic validation errors
                         self.client.validation_error_counter.add_validation_errors(
                             consumer=consumer_identifier,
-                            method=request.method,
+                            method=method,
                             path=path,
                             detail=body["detail"],
                         )
                 if response_status == 500 and exception is not None:
                     self.client.server_error_counter.add_server_error(
                         consumer=consumer_identifier,
-                        method=request.method,
+                        method=method,
                         path=path,
                         exception=exception,
                     )
@@ -259,20 +294,20 @@ class ApitallyMiddleware:
                 self.client.request_logger.log_request(
                     request={
                         "timestamp": timestamp,
-                        "method": request.method,
+                        "method": method,
                         "path": path,
-                        "url": str(request.url),
-                        "headers": request.headers.items(),
+                        "url": str(URL(scope=scope)),
+                        "headers": decode_headers(scope["headers"]),
                         "size": request_size,
                         "consumer": consumer_identifier,
-                        "body": request_body,
+                        "body": request_body_bytes,
                     },
                     response={
                         "status_code": response_status,
                         "response_time": response_time,
-                        "headers": response_headers.items(),
+                        "headers": decode_headers(response_headers),
                         "size": response_size,
-                        "body": response_body,
+                        "body": response_body_bytes,
                     },
                     exception=exception,
                     logs=logs,
@@ -281,42 +316,57 @@ class ApitallyMiddleware:
                 )
 
     def get_route_name(self, request: Request) -> Optional[str]:
-        endpoint = request.scope.get("endpoint")
-        if endpoint is not None and hasattr(endpoint, "__name__"):
-            return endpoint.__name__
-        return None
+        return self._get_route_name(request.scope)
 
     def get_route_path(self, request: Request, routes: Optional[list[BaseRoute]] = None) -> Optional[str]:
         if routes is None:
-            # FastAPI 0.138+ stores the resolved route (with the full path) in the scope
-            route_context = request.scope.get("fastapi", {}).get("effective_route_context")
-            route_path = getattr(route_context, "path", None)
-            if route_path:
-                return request.scope.get("root_path", "") + route_path
-            routes = request.app.routes
-        for route in routes:
-            if hasattr(route, "routes"):
-                path = self.get_route_path(request, routes=route.routes)  # ty: ignore[invalid-argument-type]
-                if path is not None:
-                    return path
-            elif hasattr(route, "path"):
-                match, _ = route.matches(request.scope)
-                if match == Match.FULL:
-                    return request.scope.get("root_path", "") + route.path
-        return None
+            return self._get_route_path(request.scope)
+        route = _find_route(request.scope, routes)
+        if route is None:
+            return None
+        return request.scope.get("root_path", "") + route.path  # ty: ignore[unresolved-attribute]
 
     def get_consumer(self, request: Request) -> Optional[ApitallyConsumer]:
-        if hasattr(request.state, "apitally_consumer") and request.state.apitally_consumer:
-            return ApitallyConsumer.from_string_or_object(request.state.apitally_consumer)
-        if hasattr(request.state, "consumer_identifier") and request.state.consumer_identifier:
+        return self._get_consumer(request.scope, request)
+
+    def _get_route_name(self, scope: Scope) -> Optional[str]:
+        endpoint = scope.get("endpoint")
+        if endpoint is not None and hasattr(endpoint, "__name__"):
+            return endpoint.__name__
+        return None
+
+    def _get_route_path(self, scope: Scope) -> Optional[str]:
+        root_path = scope.get("root_path", "")
+        # FastAPI 0.138+ stores the resolved route (with the full path) in the scope
+        route_context = scope.get("fastapi", {}).get("effective_route_context")
+        route_path = getattr(route_context, "path", None)
+        if route_path:
+            return root_path + route_path
+        # Check the route last matched for the same endpoint first, to avoid scanning all routes on every request
+        endpoint = scope.get("endpoint")
+        route = self.route_cache.get(id(endpoint)) if endpoint is not None else None
+        if route is None or route.matches(scope)[0] != Match.FULL:
+            route = _find_route(scope, scope["app"].routes)
+            if route is None:
+                return None
+            if endpoint is not None:
+                self.route_cache[id(endpoint)] = route
+        return root_path + route.path  # ty: ignore[unresolved-attribute]
+
+    def _get_consumer(self, scope: Scope, request: Optional[Request] = None) -> Optional[ApitallyConsumer]:
+        # Read directly from the scope state, as `hasattr` on `request.state` goes through `__getattr__`
+        state = scope.get("state", {})
+        if consumer := state.get("apitally_consumer"):
+            return ApitallyConsumer.from_string_or_object(consumer)
+        if consumer_identifier := state.get("consumer_identifier"):
             warn(
                 "Providing a consumer identifier via `request.state.consumer_identifier` is deprecated, "
                 "use `request.state.apitally_consumer` instead.",
                 DeprecationWarning,
             )
-            return ApitallyConsumer.from_string_or_object(request.state.consumer_identifier)
+            return ApitallyConsumer.from_string_or_object(consumer_identifier)
         if self.consumer_callback is not None:
-            consumer = self.consumer_callback(request)
+            consumer = self.consumer_callback(request if request is not None else Request(scope))
             return ApitallyConsumer.from_string_or_object(consumer)
         return None
 
@@ -325,11 +375,29 @@ def set_consumer(request: Request, identifier: str, name: Optional[str] = None,
     request.state.apitally_consumer = ApitallyConsumer(identifier, name=name, group=group)
 
 
-def _get_startup_data(
+def _find_route(scope: Scope, routes: list[BaseRoute]) -> Optional[BaseRoute]:
+    method = scope["method"]
+    for route in routes:
+        if hasattr(route, "routes"):
+            found = _find_route(scope, route.routes)  # ty: ignore[invalid-argument-type]
+            if found is not None:
+                return found
+        elif hasattr(route, "path"):
+            # Routes for other methods can only ever be a partial match, so skip the path regex for them
+            methods = getattr(route, "methods", None)
+            if methods is not None and method not in methods:
+                continue
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route
+    return None
+
+
+async def _get_startup_data(
     app: ASGIApp, app_version: Optional[str] = None, openapi_url: Optional[str] = None
 ) -> dict[str, Any]:
     data: dict[str, Any] = {}
-    if openapi_url and (openapi := _get_openapi(app, openapi_url)):
+    if openapi_url and (openapi := await _get_openapi(app, openapi_url)):
         data["openapi"] = openapi
     try:
         data["paths"] = [
@@ -342,14 +410,56 @@ def _get_startup_data(
     return data
 
 
-def _get_openapi(app: ASGIApp, openapi_url: str) -> Optional[str]:
+async def _get_openapi(app: ASGIApp, openapi_url: str) -> Optional[str]:
+    # Call the app directly instead of via TestClient, which would block the event loop while running the
+    # request on a separate thread
+    scope: Scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "client": ("testclient", 50000),
+        "root_path": "",
+        "path": openapi_url,
+        "raw_path": openapi_url.encode(),
+        "query_string": b"",
+        "headers": [(b"host", b"testserver")],
+        "state": {},
+    }
+    status_code = 0
+    body = bytearray()
+    request_sent = False
+    response_complete = asyncio.Event()
+
+    async def receive() -> Message:
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Apps listening for a disconnect (e.g. StreamingResponse) must wait here until the response is complete
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        nonlocal status_code
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+        elif message["type"] == "http.response.body":
+            body.extend(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_complete.set()
+
     try:
-        client = TestClient(app, raise_server_exceptions=False)
-        response = client.get(openapi_url)
-        response.raise_for_status()
-        return response.text
-    except HTTPStatusError:
+        await app(scope, receive, send)
+        if not 200 <= status_code < 300:
+            return None
+        return body.decode()
+    except Exception:
         return None
+    finally:
+        response_complete.set()
 
 
 def _get_endpoint_info(app: ASGIApp) -> list[EndpointInfo]:
@@ -359,12 +469,13 @@ def _get_endpoint_info(app: ASGIApp) -> list[EndpointInfo]:
 
 
 def _get_routes(app: Union[ASGIApp, Router]) -> list[BaseRoute]:
-    if not isinstance(app, Router):
-        if hasattr(app, "app"):
-            return _get_routes(app.app)  # ty: ignore[invalid-argument-type]
+    router = app
+    while not isinstance(router, Router) and hasattr(router, "app"):
+        router = router.app
+    if not isinstance(router, Router):
         return []  # pragma: no cover
     routes = []
-    for route in app.routes:
+    for route in router.routes:
         # FastAPI 0.138+ no longer flattens included routers into `app.routes`, and Starlette's
         # SchemaGenerator doesn't understand them, so expand them into their underlying routes
         effective_route_contexts = getattr(route, "effective_route_contexts", None)
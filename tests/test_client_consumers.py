@@ -32,3 +32,20 @@ def test_consumer_registry():
     assert data[0]["group"] == "Test 2"
     assert len(consumer_registry.updated) == 0
     assert len(consumer_registry.consumers) == 1
+
+
+def test_consumer_from_string_or_object():
+    from apitally.client.consumers import Consumer
+
+    assert Consumer.from_string_or_object(None) is None
+    assert Consumer.from_string_or_object("") is None
+    assert Consumer.from_string_or_object("  ") is None
+
+    consumer = Consumer.from_string_or_object(" test ")
+    assert consumer is not None
+    assert consumer.identifier == "test"
+    assert consumer.name is None
+    assert Consumer.from_string_or_object(" test ") is consumer
+
+    consumer = Consumer("test", name="Test")
+    assert Consumer.from_string_or_object(consumer) is consumer
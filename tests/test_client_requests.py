@@ -48,3 +48,20 @@ def test_request_counter():
     assert data[1]["request_size_sum"] > 0
     assert data[1]["response_size_sum"] == 0
     assert data[1]["request_sizes"][0] == 1
+
+
+def test_request_counter_response_time_bins():
+    from apitally.client.requests import RequestCounter
+
+    requests = RequestCounter()
+    for response_time in (0.0, 0.009, 0.01, 0.29, 0.47, 0.57, 0.579, 1.13):
+        requests.add_request(
+            consumer=None,
+            method="GET",
+            path="/test",
+            status_code=200,
+            response_time=response_time,
+        )
+
+    data = requests.get_and_reset_requests()
+    assert data[0]["response_times"] == {0: 2, 10: 1, 290: 1, 470: 1, 570: 2, 1130: 1}
@@ -60,9 +60,10 @@ def app(module_mocker: MockerFixture) -> FastAPI:
     return app
 
 
-def test_get_openapi(app: FastAPI):
+async def test_get_openapi(app: FastAPI):
     from apitally.starlette import _get_openapi
 
-    openapi = _get_openapi(app, "/openapi.json")
+    openapi = await _get_openapi(app, "/openapi.json")
     assert openapi is not None
     assert len(openapi) > 0
+    assert await _get_openapi(app, "/not-found") is None
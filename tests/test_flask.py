@@ -174,10 +174,39 @@ def test_middleware_tracing(app: Flask, mocker: MockerFixture):
 
 
 def test_get_startup_data(app: Flask):
+    from apitally.common import get_versions
     from apitally.flask import _get_startup_data
 
-    data = _get_startup_data(app, app_version="1.2.3", openapi_url="/openapi.json")
+    versions = get_versions("flask", app_version="1.2.3")
+    data = _get_startup_data(app, versions, openapi_url="/openapi.json")
     assert len(data["paths"]) == 4
     assert data["versions"]["flask"]
     assert data["versions"]["app"] == "1.2.3"
     assert data["client"] == "python:flask"
+
+
+def test_get_openapi():
+    from flask import Flask
+
+    from apitally.flask import _get_openapi
+
+    app = Flask("test_openapi")
+
+    @app.route("/openapi.json")
+    def openapi():
+        return {"openapi": "3.1.0"}
+
+    @app.route("/error.json")
+    def error():
+        raise RuntimeError("error")
+
+    @app.route("/none.json")
+    def none():
+        return None
+
+    spec = _get_openapi(app, "/openapi.json")
+    assert spec is not None
+    assert '"openapi"' in spec
+    assert _get_openapi(app, "/error.json") is None
+    assert _get_openapi(app, "/none.json") is None
+    assert _get_openapi(app, "/not-found.json") is None
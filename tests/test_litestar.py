@@ -251,3 +251,80 @@ def test_get_startup_data(app: Litestar, mocker: MockerFixture):
     assert data["versions"]["litestar"]
     assert data["versions"]["app"] == "1.2.3"
     assert data["client"] == "python:litestar"
+
+
+def test_middleware_disabled(mocker: MockerFixture):
+    from apitally.litestar import ApitallyPlugin
+
+    mocker.patch("apitally.client.client_asyncio.ApitallyClient._instance", None)
+    plugin = ApitallyPlugin(client_id="xxx")
+    assert plugin.client.enabled is False
+
+    app = mocker.AsyncMock()
+    assert plugin.middleware_factory(app) is app
+
+
+def test_middleware_request_hooks(mocker: MockerFixture):
+    from litestar.app import Litestar
+    from litestar.connection import Request
+    from litestar.handlers import get
+    from litestar.testing import TestClient
+
+    from apitally.litestar import ApitallyConsumer, ApitallyPlugin
+
+    class CustomApitallyPlugin(ApitallyPlugin):
+        def get_route_path(self, request: Request) -> Optional[str]:
+            return "/custom" + (super().get_route_path(request) or "")
+
+        def get_consumer(self, request: Request) -> Optional[ApitallyConsumer]:
+            return ApitallyConsumer("custom")
+
+    async def mocked_handle_shutdown(_):
+        pass
+
+    @get("/foo/{bar:str}")
+    async def foo_bar(bar: str) -> str:
+        return f"foo: {bar}"
+
+    mocker.patch("apitally.client.client_asyncio.ApitallyClient._instance", None)
+    mocker.patch("apitally.client.client_asyncio.ApitallyClient.start_sync_loop")
+    mocker.patch("apitally.client.client_asyncio.ApitallyClient.handle_shutdown", mocked_handle_shutdown)
+    mock = mocker.patch("apitally.client.requests.RequestCounter.add_request")
+
+    plugin = CustomApitallyPlugin(client_id=CLIENT_ID, env=ENV)
+    app = Litestar(route_handlers=[foo_bar], plugins=[plugin])
+
+    with TestClient(app) as client:
+        response = client.get("/foo/123")
+        assert response.status_code == 200
+        mock.assert_called_once()
+        assert mock.call_args is not None
+        assert mock.call_args.kwargs["path"] == "/custom/foo/{bar:str}"
+        assert mock.call_args.kwargs["consumer"] == "custom"
+
+
+def test_get_validation_error_detail():
+    from apitally.litestar import _get_validation_error_detail
+
+    body = {
+        "detail": "Validation failed for GET /val",
+        "extra": [
+            {"message": "Expected `int`", "key": "foo", "source": "query"},
+            {"message": "Field required", "key": "a.b"},
+            "not a dict",
+            ["not", "a", "dict"],
+            {"message": "Non-string key", "key": 1},
+            {"key": "missing_message"},
+        ],
+    }
+    assert _get_validation_error_detail(body) == [
+        {"loc": ["query", "foo"], "msg": "Expected `int`", "type": ""},
+        {"loc": ["body", "a", "b"], "msg": "Field required", "type": ""},
+    ]
+
+    assert _get_validation_error_detail({"detail": 1, "extra": []}) is None
+    assert _get_validation_error_detail({"detail": "Not found", "extra": []}) is None
+    assert _get_validation_error_detail({"detail": "Validation failed", "extra": "foo"}) is None
+    assert _get_validation_error_detail({"detail": "Validation failed"}) is None
+    assert _get_validation_error_detail(["detail", "extra"]) is None
+    assert _get_validation_error_detail("Validation failed") is None
@@ -5,6 +5,7 @@ from typing import TYPE_CHECKING, Iterator
 
 import pytest
 from pytest_httpx import HTTPXMock
+from pytest_mock import MockerFixture
 from requests_mock import Mocker as RequestsMocker
 
 
@@ -78,6 +79,32 @@ async def test_instrument_async_function(span_exporter: InMemorySpanExporter) ->
     )
 
 
+def test_instrument_without_tracer_provider(span_exporter: InMemorySpanExporter, mocker: MockerFixture) -> None:
+    from opentelemetry import trace
+    from opentelemetry.trace import ProxyTracer
+
+    from apitally.otel import instrument
+
+    tracer = ProxyTracer("apitally.otel")
+    mocker.patch("apitally.otel._tracer", tracer)
+    mocker.patch("apitally.otel._has_tracer_provider", False)
+    mocker.patch("opentelemetry.trace._TRACER_PROVIDER", None)
+    start_span_spy = mocker.spy(tracer, "start_as_current_span")
+    get_tracer_provider_spy = mocker.spy(trace, "get_tracer_provider")
+
+    @instrument
+    def my_sync_function(x: int) -> int:
+        return x * 2
+
+    result = my_sync_function(5)
+
+    # The skip path neither creates a span nor looks up the global tracer provider
+    assert result == 10
+    assert len(span_exporter.get_finished_spans()) == 0
+    start_span_spy.assert_not_called()
+    get_tracer_provider_spy.assert_not_called()
+
+
 def test_span_context_manager(span_exporter: InMemorySpanExporter) -> None:
     from apitally.otel import span
 
@@ -362,14 +362,84 @@ def test_middleware_tracing(app: Starlette, mocker: MockerFixture):
         assert isinstance(mock.call_args.kwargs["trace_id"], int)
 
 
-def test_get_startup_data(app: Starlette, mocker: MockerFixture):
+def test_middleware_request_hooks(mocker: MockerFixture):
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Route
+    from starlette.testclient import TestClient
+
+    from apitally.starlette import ApitallyConsumer, ApitallyMiddleware
+
+    class CustomApitallyMiddleware(ApitallyMiddleware):
+        def get_route_path(self, request: Request, routes=None) -> Optional[str]:
+            return "/custom" + (super().get_route_path(request, routes) or "")
+
+        def get_consumer(self, request: Request) -> Optional[ApitallyConsumer]:
+            return ApitallyConsumer("custom")
+
+    def foo(request: Request):
+        return PlainTextResponse("foo")
+
+    mocker.patch("apitally.client.client_asyncio.ApitallyClient._instance", None)
+    mocker.patch("apitally.client.client_asyncio.ApitallyClient.start_sync_loop")
+    mocker.patch("apitally.client.client_asyncio.ApitallyClient.handle_shutdown")
+    mock = mocker.patch("apitally.client.requests.RequestCounter.add_request")
+
+    app = Starlette(routes=[Route("/foo/{bar}", foo)])
+    app.add_middleware(CustomApitallyMiddleware, client_id=CLIENT_ID, env=ENV)
+
+    with TestClient(app) as client:
+        response = client.get("/foo/123")
+        assert response.status_code == 200
+        mock.assert_called_once()
+        assert mock.call_args is not None
+        assert mock.call_args.kwargs["path"] == "/custom/foo/{bar}"
+        assert mock.call_args.kwargs["consumer"] == "custom"
+
+
+def test_middleware_route_cache(mocker: MockerFixture):
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Mount, Route
+    from starlette.testclient import TestClient
+
+    from apitally.starlette import ApitallyMiddleware
+
+    def shared(request: Request):
+        return PlainTextResponse("shared")
+
+    mocker.patch("apitally.client.client_asyncio.ApitallyClient._instance", None)
+    mocker.patch("apitally.client.client_asyncio.ApitallyClient.start_sync_loop")
+    mocker.patch("apitally.client.client_asyncio.ApitallyClient.handle_shutdown")
+    mock = mocker.patch("apitally.client.requests.RequestCounter.add_request")
+
+    app = Starlette(
+        routes=[
+            Route("/a/{id:int}", shared),
+            Route("/b", shared),
+            Mount("/sub", routes=[Route("/c", shared)]),
+        ]
+    )
+    app.add_middleware(ApitallyMiddleware, client_id=CLIENT_ID, env=ENV)
+
+    # Alternate between routes sharing the same endpoint, so the cached route often doesn't match
+    requests = ["/a/1", "/b", "/a/2", "/sub/c", "/sub/c", "/b", "/a/3"]
+    expected_paths = ["/a/{id:int}", "/b", "/a/{id:int}", "/sub/c", "/sub/c", "/b", "/a/{id:int}"]
+    with TestClient(app) as client:
+        for url in requests:
+            assert client.get(url).status_code == 200
+
+    assert [call.kwargs["path"] for call in mock.call_args_list] == expected_paths
+
+
+async def test_get_startup_data(app: Starlette, mocker: MockerFixture):
     from apitally.starlette import _get_startup_data
 
     mocker.patch("apitally.starlette.ApitallyClient")
     if app.middleware_stack is None:
         app.middleware_stack = app.build_middleware_stack()
 
-    data = _get_startup_data(app=app.middleware_stack, app_version="1.2.3", openapi_url=None)
+    data = await _get_startup_data(app=app.middleware_stack, app_version="1.2.3", openapi_url=None)
     assert len(data["paths"]) == 8
     assert {"method": "get", "path": "/api/foo"} in data["paths"]
     assert {"method": "post", "path": "/test/task"} in data["paths"]
@@ -377,3 +447,25 @@ def test_get_startup_data(app: Starlette, mocker: MockerFixture):
     assert data["versions"]["starlette"]
     assert data["versions"]["app"] == "1.2.3"
     assert data["client"] == "python:starlette"
+
+
+async def test_get_openapi_streaming():
+    from starlette.applications import Starlette
+    from starlette.responses import StreamingResponse
+    from starlette.routing import Route
+
+    from apitally.starlette import _get_openapi
+
+    async def stream_openapi():
+        yield b'{"openapi": '
+        yield b'"3.1.0"}'
+
+    def openapi(request: Request):
+        return StreamingResponse(stream_openapi(), media_type="application/json")
+
+    def invalid(request: Request):
+        return StreamingResponse(iter([b"\xff"]), media_type="application/json")
+
+    app = Starlette(routes=[Route("/openapi.json", openapi), Route("/invalid.json", invalid)])
+    assert await asyncio.wait_for(_get_openapi(app, "/openapi.json"), timeout=5) == '{"openapi": "3.1.0"}'
+    assert await asyncio.wait_for(_get_openapi(app, "/invalid.json"), timeout=5) is None